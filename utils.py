@@ -2,9 +2,52 @@ import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 
 from plotly.subplots import make_subplots
 
+_cumpct_numba = None
+
+def _cumpct(vals):
+    """Computes the share of each value in the total and their cumulative sum
+    in a single pass.
+
+    Parameters
+    ----------
+    vals (np.ndarray): Values sorted in descending order.
+
+    Returns
+    -------
+    tuple of np.ndarray (pct, cumsum_pct)
+    """
+    total = vals.sum()
+    pct = np.empty_like(vals)
+    cumsum_pct = np.empty_like(vals)
+    acc = 0.0
+    for i in range(vals.shape[0]):
+        pct[i] = np.round(vals[i] / total, 8)
+        acc += pct[i]
+        cumsum_pct[i] = acc
+    return pct, cumsum_pct
+
+def _join_cols(data, cols):
+    """Concatenates the given columns into a single ' - ' separated string
+    column.
+
+    Parameters
+    ----------
+    data (pd.DataFrame): Table containing the columns to be joined.
+    cols (list): List of the columns to be joined.
+
+    Returns
+    -------
+    pd.Series
+    """
+    joined = data[cols[0]].astype(str)
+    if len(cols) == 1:
+        return joined
+    return joined.str.cat([data[c].astype(str) for c in cols[1:]], sep=' - ')
+
 def id_time_coverage(data, y, time_var, args=dict()):
     """Displays the time coverage for each ID.
 
@@ -21,16 +64,18 @@ def id_time_coverage(data, y, time_var, args=dict()):
     plotly.graph_objs._figure.Figure
     """
     data = (data
-            .assign(id = lambda d: d[y].agg(' - '.join, axis=1))
-            .groupby(['id', time_var], as_index=False)
-            .sum())
+            .groupby(y + [time_var], as_index=False, observed=True)
+            .sum()
+            .assign(id = lambda d: _join_cols(d, y)))
 
-    fig = px.scatter(data, y='id', x=time_var, **args, height=100+25*len(data['id'].unique()))
-    fig.update_yaxes(categoryorder='array', categoryarray= data['id'].unique())
+    ids = data['id'].unique()
+
+    fig = px.scatter(data, y='id', x=time_var, **args, height=100+25*len(ids))
+    fig.update_yaxes(categoryorder='array', categoryarray=ids)
 
     return fig
 
-def id_importance(data, id_vars, cumul_var, type='tab'):
+def id_importance(data, id_vars, cumul_var, type='tab', engine='pandas'):
     """Returns the cumulative importance table or graph of the identifiers.
 
     Parameters
@@ -41,22 +86,44 @@ def id_importance(data, id_vars, cumul_var, type='tab'):
     combination of multiple ID.
     cumul_var (string): Name of the variable to be aggregated.
     type (string): Either 'tab' or 'graph'.
+    engine (string): Either 'pandas' or 'numba'. If 'numba', the percentages
+    and their cumulative sum are computed by a compiled kernel. Requires numba.
 
     Returns
     -------
     If type == 'tab', returns a pd.DataFrame
     If type == "graph", returns a plotly.graph_objs._figure.Figure
     """
+    if engine not in ('pandas', 'numba'):
+        raise ValueError(f"engine must be 'pandas' or 'numba', got {engine!r}")
+
     tab = (
         data
-        .groupby(id_vars, as_index=False)
+        .groupby(id_vars, as_index=False, observed=True)
         .agg(sum=(cumul_var, 'sum'))
-        .assign(pct=lambda d: (d['sum']/sum(d['sum'])).round(8))
-        .sort_values('pct', ascending=False, ignore_index=True)
-        .assign(cumsum_pct=lambda d: d['pct'].cumsum())
-        .rename(columns={'cumsum_pct': 'cumulative sum' + cumul_var})
         )
 
+    if engine == 'numba':
+        global _cumpct_numba
+        if _cumpct_numba is None:
+            try:
+                import numba
+            except ImportError:
+                raise ImportError(
+                    "numba is required for engine='numba'") from None
+            _cumpct_numba = numba.njit(cache=True,
+                                       error_model='numpy')(_cumpct)
+        tab = tab.sort_values('sum', ascending=False, ignore_index=True)
+        pct, cumsum_pct = _cumpct_numba(tab['sum'].to_numpy(dtype=np.float64))
+        tab = tab.assign(pct=pct, cumsum_pct=cumsum_pct)
+    else:
+        tab = (tab
+               .assign(pct=lambda d: (d['sum']/d['sum'].sum()).round(8))
+               .sort_values('pct', ascending=False, ignore_index=True)
+               .assign(cumsum_pct=lambda d: d['pct'].cumsum()))
+
+    tab = tab.rename(columns={'cumsum_pct': 'cumulative sum' + cumul_var})
+
     if type == "graph":
         tab = (tab
                .reset_index()
@@ -89,27 +156,28 @@ def id_cross_importance(data, id1, id2, weight_var, x_var='pct', title=''):
     """
 
     tab = (data
-           .groupby(id1 + id2, as_index=False)
+           .groupby(id1 + id2, as_index=False, observed=True)
            .agg(val=(weight_var, 'sum'))
-           .assign(id1=lambda d: d[id1].agg(' - '.join, axis=1),
-                   id2=lambda d: d[id2].agg(' - '.join, axis=1))
+           .assign(id1=lambda d: _join_cols(d, id1).astype('category'),
+                   id2=lambda d: _join_cols(d, id2))
            )
 
-    order = (tab
-              .groupby('id1').agg(total=('val', 'sum'))
-              .sort_values('total', ascending=True).index.tolist())
+    cat = tab['id1'].cat
+    totals = np.bincount(cat.codes, weights=tab['val'].to_numpy(),
+                         minlength=len(cat.categories))
+    order = cat.categories[np.argsort(totals, kind='stable')].tolist()
 
     tab = (
         tab
-        .merge(tab
-               .groupby('id1', as_index=False)
-               .agg(total=('val', 'sum')), on='id1')
-        .assign(pct=lambda d: d['val']/d['total'])
-        .sort_values(['id1', 'pct'], ascending=False, ignore_index=True)
-        .groupby('id1', as_index=False)
-        .apply(lambda d: d.reset_index(drop=True)).reset_index()
-        .assign(top=lambda d: d['level_1'].astype('category'))
-        .drop(['level_0', 'level_1'], axis=1)
+        .assign(total=lambda d: (d.groupby('id1', sort=False, observed=True)
+                                 ['val'].transform('sum')),
+                pct=lambda d: d['val']/d['total'])
+        .assign(id1_code=lambda d: d['id1'].cat.codes)
+        .sort_values(['id1_code', 'pct'], ascending=[True, False],
+                     ignore_index=True)
+        .drop('id1_code', axis=1)
+        .assign(top=lambda d: (d.groupby('id1', sort=False, observed=True)
+                               .cumcount().astype('category')))
         .assign(pct_str=lambda d: (100*d['pct']).round(1).astype('str') + '%')
         )
 
@@ -147,19 +215,14 @@ def ts_lag(data, id_vars, time_var, lagged_vars, period, n_period):
     """
 
     period_str = str(n_period) + period
+    offset = pd.to_timedelta(n_period, period).to_timedelta64()
 
-    dict_rename = {time_var: 'to_join'}
+    df_lag = {var: data[var].array for var in id_vars}
+    df_lag['to_join'] = data[time_var].array + offset
     for var in lagged_vars:
-        dict_rename[var] = f'lag_{period_str}_{var}'
+        df_lag[f'lag_{period_str}_{var}'] = data[var].array
 
-    df_lag = (
-        data[id_vars + [time_var] + lagged_vars]
-        .rename(columns=dict_rename)
-        .assign(to_join=lambda d: d['to_join'] +
-                pd.to_timedelta(n_period, period))
-    )
-
-    return df_lag
+    return pd.DataFrame(df_lag, index=data.index)
 
 def ts_visualisation(data, list_id, group, x_var, y_var, col_var,
                      threshold_train=None, weekdays=False, scatter=False):
@@ -184,53 +247,78 @@ def ts_visualisation(data, list_id, group, x_var, y_var, col_var,
     plotly.graph_objs._figure.Figure
     """
 
-    figs = dict()
     params = []
+    traces_per_id = []
     final_fig = make_subplots(specs=[[{"secondary_y": True}]])
 
+    df_ids = data[data[group].isin(list_id)]
+    if weekdays:
+        df_ids = df_ids.assign(weekday_name=lambda d: d[x_var].dt.day_name())
+
+    groups = {k: v for k, v in df_ids.groupby(group, sort=False, observed=True)}
+    xmax = data[x_var].max()
+
+    hover = f'<br>{x_var}=%{{x}}<br>value=%{{y}}<extra></extra>'
+    if weekdays:
+        template = px.defaults.template or pio.templates.default or 'plotly'
+        if not isinstance(template, go.layout.Template):
+            template = pio.templates[template]
+        colors = (px.defaults.color_discrete_sequence
+                  or template.layout.colorway or px.colors.qualitative.D3)
+
     for i in range(0, len(list_id)):
         id = list_id[i]
-        df_id = data.loc[data[group] == id]
+        if id not in groups:
+            traces_per_id.append(0)
+            continue
+        df_id = groups[id]
 
-        figs[id] = {'final': make_subplots(specs=[[{"secondary_y": True}]]),
-                    'vars': px.line(df_id, x=x_var, y=y_var,
-                                       color_discrete_sequence=col_var)}
+        x = df_id[x_var].to_numpy()
 
-        figs[id]['vars'].update_xaxes(tickformat="%a %d-%m")
-
-        figs[id]['final'].add_traces(data=figs[id]['vars'].data)
+        id_traces = [go.Scattergl(x=x, y=df_id[var].to_numpy(), mode='lines',
+                                  line=dict(color=col_var[j % len(col_var)]),
+                                  name=var, legendgroup=var,
+                                  hovertemplate=f'variable={var}' + hover)
+                     for j, var in enumerate(y_var)]
 
         if scatter:
-            figs[id]['vars_scatter'] = (
-              px.scatter(df_id, x=x_var, y=y_var,
-                         color_discrete_sequence=col_var))
-            figs[id]['final'].add_traces(data=figs[id]['vars_scatter'].data)
+            id_traces.extend(
+              go.Scattergl(x=x, y=df_id[var].to_numpy(), mode='markers',
+                           marker=dict(color=col_var[j % len(col_var)]),
+                           name=var, legendgroup=var,
+                           hovertemplate=f'variable={var}' + hover)
+              for j, var in enumerate(y_var))
         if weekdays:
-            df_id = df_id.assign(weekday_name=lambda d: d[x_var].dt.day_name())
-            figs[id]['weekdays'] = px.scatter(df_id, x=x_var, y=y_var,
-                                              color='weekday_name')
-
-            marker_type = dict(size=8, line=dict(width=1,  color='black'))
-            selector_type = dict(mode='markers')
-            figs[id]['weekdays'].update_traces(marker=marker_type,
-                                               selector=selector_type)
-
-            figs[id]['final'].add_traces(data=figs[id]['weekdays'].data)
-
-        final_fig.add_traces(data=figs[id]['final'].data)
-
-        list_show = [False] * len(list_id)
-        list_show[i] = True
-        param = {'args': [{'visible': np.repeat([list_show],
-                                                len(figs[id]['final'].data))},
+            weekday_name = df_id['weekday_name'].to_numpy()
+
+            for j, day in enumerate(pd.unique(weekday_name)):
+                mask = weekday_name == day
+                marker_type = dict(color=colors[j % len(colors)], size=8,
+                                   line=dict(width=1,  color='black'))
+                id_traces.append(go.Scattergl(
+                    x=np.tile(x[mask], len(y_var)),
+                    y=np.concatenate([df_id[var].to_numpy()[mask]
+                                      for var in y_var]),
+                    mode='markers', marker=marker_type,
+                    name=day, legendgroup=day,
+                    hovertemplate=f'weekday_name={day}' + hover))
+
+        final_fig.add_traces(data=id_traces)
+        traces_per_id.append(len(id_traces))
+
+    offsets = np.cumsum([0] + traces_per_id)
+    for i in range(0, len(list_id)):
+        visible = np.zeros(offsets[-1], dtype=bool)
+        visible[offsets[i]:offsets[i+1]] = True
+        param = {'args': [{'visible': visible.tolist()},
                           {'showlegend' : True,
-                          'title': f'id = {id}'}],
-                'label': id,
+                          'title': f'id = {list_id[i]}'}],
+                'label': list_id[i],
                 'method': 'update'}
         params.append(param)
 
     if threshold_train is not None:
-        final_fig.add_vrect(x0=threshold_train, x1=data[x_var].max(),
+        final_fig.add_vrect(x0=threshold_train, x1=xmax,
                             fillcolor="LightSeaGreen", layer="below",
                             line_width=0)
 